@@ -0,0 +1,65 @@
+"""Startup-time benchmark for llcomp and duo_fit_inp.
+
+Times a cold import of each module in a fresh interpreter, and checks that
+no heavy dependency is imported as a side effect. Exits with a non-zero
+status if a heavy dependency is loaded at import time. Import times depend
+on the machine, so they are only reported, unless a limit is given.
+
+usage
+    python benchmarks/bench_startup.py [--repeat N] [--limit SECONDS]
+"""
+import argparse, os, subprocess, sys
+
+MODULES = ["llcomp", "llcomp.data", "llcomp.index", "llcomp.linelist", "duo_fit_inp"]
+HEAVY_DEPENDENCIES = ["pandas", "numpy"]
+
+TIMING_SNIPPET = """
+import sys, time
+start = time.perf_counter()
+import {module}
+elapsed = time.perf_counter() - start
+loaded = [name for name in {heavy!r} if name in sys.modules]
+print(elapsed, ",".join(loaded))
+"""
+
+def time_import(module, repo_root):
+    """Import a module in a fresh interpreter, returning the import time in
+    seconds and the heavy dependencies it loaded."""
+    output = subprocess.run(
+        [sys.executable, "-c", TIMING_SNIPPET.format(module=module, heavy=HEAVY_DEPENDENCIES)],
+        cwd=repo_root, capture_output=True, text=True, check=True
+    ).stdout.split()
+    elapsed = float(output[0])
+    loaded = output[1].split(",") if len(output) > 1 else []
+    return elapsed, loaded
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="llcomp startup-time benchmark")
+    parser.add_argument('--repeat', type=int, default=5,
+        help="Number of fresh interpreters to time each import in.")
+    parser.add_argument('--limit', type=float, default=None,
+        help="If given, also fail when the best import time of a module "
+            "exceeds this many seconds.")
+    args = parser.parse_args(argv)
+
+    repo_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    failed = False
+    for module in MODULES:
+        timings, loaded = [], set()
+        for _ in range(args.repeat):
+            elapsed, loaded_ = time_import(module, repo_root)
+            timings.append(elapsed)
+            loaded.update(loaded_)
+        best = min(timings)
+        status = "ok"
+        if loaded:
+            status = "FAIL (imported {0})".format(", ".join(sorted(loaded)))
+            failed = True
+        elif args.limit is not None and best > args.limit:
+            status = "FAIL (over {0:.3f} s limit)".format(args.limit)
+            failed = True
+        print("{0:<20} best {1:8.2f} ms  {2}".format(module, best*1000, status))
+    return 1 if failed else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,17 +1,5 @@
 import argparse, sys
 
-parser = argparse.ArgumentParser(description="Duo fitting input iterator")
-parser.add_argument(
-    'input', metavar='duo_output.out', type=str,
-    help="Reference file to generate new input from."
-    )
-parser.add_argument(
-    '-o', '--output', metavar='my_input.inp', type=str,
-    help="Name of the Duo '.inp' file to write output to, if not console." 
-)
-
-args = parser.parse_args()
-
 class fileBlock:
     def __init__(self, start_line, init_lines=[]):
         self.lines = init_lines
@@ -170,16 +158,32 @@ class Generator:
         self.count_id += 1
         self.waiting[str(self.count_id)] = (func, kwargs)
 
-gen = Generator(args.input)
-if args.output is not None:
-    fout = open(args.output, 'w+')
-    fout.close
-    for line in gen.genfromit():
-        fout = open(args.output, 'a')
-        print(line, file=fout)
-        fout.close()
-else:
-    fout = sys.stdout
-    for line in gen.genfromit():
-        print(line, file=fout)
-
+def main(argv=None):
+    """Write a new Duo fitting input generated from a fitting output, as
+    given on the command line."""
+    parser = argparse.ArgumentParser(description="Duo fitting input iterator")
+    parser.add_argument(
+        'input', metavar='duo_output.out', type=str,
+        help="Reference file to generate new input from."
+        )
+    parser.add_argument(
+        '-o', '--output', metavar='my_input.inp', type=str,
+        help="Name of the Duo '.inp' file to write output to, if not console." 
+    )
+    args = parser.parse_args(argv)
+
+    gen = Generator(args.input)
+    if args.output is not None:
+        fout = open(args.output, 'w+')
+        fout.close
+        for line in gen.genfromit():
+            fout = open(args.output, 'a')
+            print(line, file=fout)
+            fout.close()
+    else:
+        fout = sys.stdout
+        for line in gen.genfromit():
+            print(line, file=fout)
+
+if __name__ == "__main__":
+    main()
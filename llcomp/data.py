@@ -1,5 +1,10 @@
-import pandas as pd
-import numpy  as np
+import bz2, io, queue, threading
+from llcomp.lazy import LazyModule
+pd = LazyModule("pandas")
+np = LazyModule("numpy")
+
+DEFAULT_BLOCK_SIZE = 2**22 #bytes read from disk per pipeline block
+DEFAULT_QUEUE_SIZE = 4     #blocks buffered between pipeline stages
 
 def y_as_fx(dataframe, x=None, y=None):
     """Return data series x and y from the dataframe as a (n, 2) ndarray,
@@ -34,7 +39,7 @@ def detect_file_headers(filename, headers_to_detect):
     """
     use_these_columns = [] #collect recognised columns
     garbage = []
-    with open(filename, 'r') as f:
+    with open_linelist_file(filename) as f:
         line = f.readline().rstrip('\n')
         for w, word in enumerate(line.split()):
             if word in headers_to_detect: #if recognised word
@@ -46,6 +51,233 @@ def detect_file_headers(filename, headers_to_detect):
         else:
             return use_these_columns, garbage
 
+def open_linelist_file(filename):
+    """Open a linelist file for reading as text, decompressing '.bz2' files
+    on the fly."""
+    if str(filename).endswith('.bz2'):
+        return bz2.open(filename, 'rt')
+    else:
+        return open(filename, 'r')
+
+class _StageError:
+    """Wrapper for passing an exception raised in a pipeline stage downstream."""
+    def __init__(self, error):
+        self.error = error
+
+_STAGE_DONE = object() #sentinel marking the end of a pipeline stage
+
+def _put_block(block_queue, item, stop):
+    """Put item on a bounded queue, giving up if the pipeline is stopped."""
+    while not stop.is_set():
+        try:
+            block_queue.put(item, timeout=0.1)
+            return True
+        except queue.Full:
+            continue
+    return False
+
+def _drain_blocks(block_queue, stop):
+    """Yield items from a pipeline queue until the upstream stage finishes.
+    Exceptions raised upstream are re-raised here."""
+    while not stop.is_set():
+        try:
+            item = block_queue.get(timeout=0.1)
+        except queue.Empty:
+            continue
+        if item is _STAGE_DONE:
+            return
+        elif isinstance(item, _StageError):
+            raise item.error
+        yield item
+
+def _run_stage(source, block_queue, stop):
+    """Feed every item of the source iterator to the next stage's queue."""
+    try:
+        for item in source:
+            if not _put_block(block_queue, item, stop):
+                return
+        _put_block(block_queue, _STAGE_DONE, stop)
+    except BaseException as error:
+        _put_block(block_queue, _StageError(error), stop)
+    finally:
+        if hasattr(source, 'close'):
+            source.close()
+
+def _read_raw_blocks(filename, block_size):
+    """Read a file from disk in fixed size binary blocks."""
+    with open(filename, 'rb') as f:
+        while True:
+            block = f.read(block_size)
+            if not block:
+                return
+            yield block
+
+def _decompress_blocks(raw_blocks, filename, block_size):
+    """Decompress '.bz2' blocks (including multi-stream files) into blocks of
+    at most ``block_size`` bytes, otherwise pass blocks through unchanged."""
+    if not str(filename).endswith('.bz2'):
+        yield from raw_blocks
+        return
+    decompressor = bz2.BZ2Decompressor()
+    for block in raw_blocks:
+        while True:
+            if decompressor.eof: #start of the next concatenated stream
+                block = decompressor.unused_data + block
+                decompressor = bz2.BZ2Decompressor()
+                if not block:
+                    break
+            data = decompressor.decompress(block, max_length=block_size)
+            block = b''
+            if data:
+                yield data
+            if not decompressor.eof and decompressor.needs_input:
+                break
+
+def _align_blocks(blocks, skip_header):
+    """Re-cut blocks so that each one ends on a line boundary, optionally
+    dropping the first (header) line of the file."""
+    remainder = b''
+    for block in blocks:
+        block = remainder + block
+        cut = block.rfind(b'\n') + 1
+        if cut == 0: #no complete line yet
+            remainder = block
+            continue
+        block, remainder = block[:cut], block[cut:]
+        if skip_header:
+            block = block[block.find(b'\n')+1:]
+            skip_header = False
+        if block:
+            yield block
+    if skip_header:
+        remainder = b''
+    if remainder:
+        yield remainder
+
+def iter_file_blocks(filename, block_size=DEFAULT_BLOCK_SIZE,
+        queue_size=DEFAULT_QUEUE_SIZE, skip_header=True):
+    """Yield decompressed, line-aligned blocks of a file as bytes.
+
+    Reading from disk and decompression each run in a background thread,
+    connected to the caller by bounded queues, so that the next blocks are
+    prepared while the caller is still working on the current one. At most
+    ``queue_size`` blocks are buffered between each pair of stages, and
+    decompressed blocks hold at most ``block_size`` bytes plus the end of a
+    line carried over from the previous block.
+    arguments
+        filename : str
+            Name of the file to read, optionally '.bz2' compressed.
+        block_size : int
+            Number of (compressed) bytes read from disk at a time, and the
+            maximum size of a decompressed block.
+        queue_size : int
+            Maximum number of blocks buffered between stages.
+        skip_header : bool
+            If true, the first line of the file is not yielded.
+    """
+    stop = threading.Event()
+    raw_queue = queue.Queue(maxsize=queue_size)
+    text_queue = queue.Queue(maxsize=queue_size)
+    stages = [
+        (_read_raw_blocks(filename, block_size), raw_queue),
+        (_align_blocks(
+            _decompress_blocks(_drain_blocks(raw_queue, stop), filename, block_size),
+            skip_header
+        ), text_queue)
+    ]
+    threads = [
+        threading.Thread(target=_run_stage, args=(source, sink, stop), daemon=True)
+        for source, sink in stages
+    ]
+    for thread in threads:
+        thread.start()
+    try:
+        yield from _drain_blocks(text_queue, stop)
+    finally:
+        stop.set()
+        for thread in threads:
+            thread.join()
+
+def iter_dataframe_blocks(filename, use_columns, column_types, **kwargs):
+    """Yield a space delimited file with a header line as a series of
+    dataframes, one per block read by ``iter_file_blocks``.
+    arguments
+        filename : str
+            Name of the file to read, optionally '.bz2' compressed.
+        use_columns : list of lists
+            Column headers (str) and their indices (int), as returned by
+            ``detect_file_headers``.
+        column_types : dict
+            Data type for each column header.
+        **kwargs
+            Passed to ``iter_file_blocks``.
+    """
+    for block in iter_file_blocks(filename, skip_header=True, **kwargs):
+        if not block.strip():
+            continue
+        block_df = pd.read_csv(io.BytesIO(block),
+            delim_whitespace=True,
+            index_col=False,
+            header=None,
+            skip_blank_lines=True,
+            usecols=[column[1] for column in use_columns],
+            dtype={column[1] : column_types[column[0]] for column in use_columns}
+        )
+        yield block_df.rename(columns={column[1] : column[0] for column in use_columns})
+
+def empty_dataframe(use_columns, column_types):
+    """Return an empty dataframe with the columns and data types that
+    ``iter_dataframe_blocks`` would yield, for files with no lines to read."""
+    return pd.DataFrame({
+        column[0] : pd.Series(dtype=column_types[column[0]]) for column in use_columns
+    })
+
+def _hash_sample_key(column):
+    """Hash each value of a key column, so that equal keys hash to the same
+    value whatever the data type of the column or the other values in it.
+    Values that parse as numbers are hashed as floats, others as strings."""
+    if pd.api.types.is_numeric_dtype(column):
+        numeric = column.astype(np.float64)
+        is_label = np.zeros(len(column), dtype=bool)
+    else:
+        numeric = pd.to_numeric(column, errors="coerce").astype(np.float64)
+        is_label = (numeric.isna() & column.notna()).to_numpy()
+    hashes = pd.util.hash_array(numeric.to_numpy() + 0.0) #also maps -0.0 to 0.0
+    if is_label.any():
+        hashes[is_label] = pd.util.hash_array(column[is_label].astype(str).to_numpy(dtype=object))
+    return hashes
+
+def sample_mask(dataframe, sample_on, sample_fraction):
+    """Select a deterministic, hash-based sample of the rows of a dataframe.
+
+    Rows are kept if the hash of their key columns falls in the lowest
+    ``sample_fraction`` of the hash range, so rows with equal keys are always
+    kept or dropped together, in any dataframe, block or linelist.
+    arguments
+        dataframe : DataFrame
+            Data to sample.
+        sample_on : list of str
+            Names of the key columns to hash.
+        sample_fraction : float
+            Expected fraction of keys to keep, between 0 and 1.
+    returns
+        mask : ndarray of bool
+            True for rows in the sample.
+    """
+    missing = [name for name in sample_on if name not in dataframe.columns]
+    if missing:
+        raise ValueError("Cannot sample on missing columns: " + ", ".join(missing))
+    if not 0 < sample_fraction <= 1:
+        raise ValueError("'sample_fraction' must be between 0 and 1.")
+    keys = pd.DataFrame({
+        str(k) : _hash_sample_key(dataframe[name]) for k, name in enumerate(sample_on)
+    })
+    hashes = pd.util.hash_pandas_object(keys, index=False).to_numpy()
+    threshold = int(sample_fraction * 2**64)
+    if threshold >= 2**64:
+        return np.ones(len(dataframe), dtype=bool)
+    return hashes < np.uint64(threshold)
+
 def is_iterable(obj, strings=False):
     """Check if object is iterable, return boolean result.
     arguments
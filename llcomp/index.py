@@ -0,0 +1,154 @@
+import json, os, tempfile
+from llcomp.lazy import LazyModule
+pd = LazyModule("pandas")
+np = LazyModule("numpy")
+
+INDEX_VERSION = 1
+TABLE_SUFFIX = ".idx.npy"  #memory-mapped binary table, one row per state ID
+META_SUFFIX  = ".idx.json" #column layout, string code tables and source stamp
+
+class StatesIndex:
+    """Random-access binary table of an ExoMol states file.
+
+    The table is a numpy structured array memory-mapped from disk, with row
+    ``state_id - first_id`` holding the data for ``state_id``, so looking up a
+    state is O(1) and nothing is read until it is used. String columns are
+    stored as integer codes into per-column code tables, with code -1 for a
+    missing label. Rows for state IDs missing from the states file have
+    ``state_number`` set to -1.
+    """
+    def __init__(self, table, first_id, columns, code_tables):
+        self.table = table
+        self.first_id = first_id
+        self.columns = columns
+        self.code_tables = code_tables
+
+    def __len__(self):
+        return len(self.table)
+
+    def positions(self, state_ids):
+        """Return the table row of each state ID, or -1 if it is not present.
+        arguments
+            state_ids : array-like of int
+                State IDs to locate.
+        returns
+            positions : ndarray of int
+                Row index into ``table`` for each state ID.
+        """
+        state_ids = np.asarray(state_ids, dtype=np.int64)
+        if len(self.table) == 0: #index of a states file with no states
+            return np.full(len(state_ids), -1, dtype=np.int64)
+        positions = state_ids - self.first_id
+        in_range = (positions >= 0) & (positions < len(self.table))
+        positions = np.where(in_range, positions, 0)
+        found = in_range & (self.table["state_number"][positions] == state_ids)
+        return np.where(found, positions, -1)
+
+    def take(self, positions):
+        """Return the states at the given table rows as a dataframe, with
+        string columns decoded from their code tables."""
+        rows = self.table[np.asarray(positions)]
+        columns = {}
+        for name in self.columns:
+            if name in self.code_tables:
+                # Code -1 picks the trailing NaN, as for missing labels in read_csv
+                labels = np.asarray(self.code_tables[name] + [np.nan], dtype=object)
+                columns[name] = labels[rows[name]]
+            else:
+                columns[name] = rows[name]
+        return pd.DataFrame(columns)
+
+    def lookup(self, state_ids):
+        """Return the states with the given IDs as a dataframe. IDs that are
+        not in the states file are dropped."""
+        positions = self.positions(state_ids)
+        return self.take(positions[positions >= 0])
+
+def _source_stamp(states_file):
+    """Size and modification time used to detect a changed states file."""
+    stat = os.stat(states_file)
+    return {"size": stat.st_size, "mtime_ns": stat.st_mtime_ns}
+
+def build_states_index(states_file, states_df):
+    """Convert a states dataframe to a binary states index stored alongside
+    the states file, and return it.
+    arguments
+        states_file : str
+            Path to the Exomol '.states' file the dataframe was read from.
+        states_df : DataFrame
+            The states data, including a ``state_number`` column.
+    returns
+        StatesIndex
+            The index, memory-mapped from the newly written table.
+    """
+    if "state_number" not in states_df.columns:
+        raise ValueError("A 'state_number' column is required to index states.")
+    state_ids = states_df["state_number"].to_numpy(dtype=np.int64)
+    first_id = int(state_ids.min()) if len(state_ids) else 0
+    num_rows = int(state_ids.max()) - first_id + 1 if len(state_ids) else 0
+    positions = state_ids - first_id
+    dtypes, code_tables, values = [], {}, {}
+    for name in states_df.columns:
+        column = states_df[name]
+        if pd.api.types.is_numeric_dtype(column):
+            values[name] = column.to_numpy()
+        else:
+            codes, uniques = pd.factorize(column) #missing labels get code -1
+            values[name] = codes.astype(np.int32)
+            code_tables[name] = [str(_) for _ in uniques]
+        dtypes.append((name, values[name].dtype))
+    table = np.zeros(num_rows, dtype=dtypes)
+    table["state_number"] = -1 #marks state IDs absent from the states file
+    for name in states_df.columns:
+        table[name][positions] = values[name]
+    meta = {
+        "version": INDEX_VERSION,
+        "source": _source_stamp(states_file),
+        "first_id": first_id,
+        "columns": [_ for _ in states_df.columns],
+        "code_tables": code_tables
+    }
+    # Write to uniquely named temporary files first, so that a partial index
+    # is never picked up and concurrent builds of the same index (which
+    # write identical files) cannot clobber each other
+    _replace_atomically(states_file + TABLE_SUFFIX, lambda f: np.save(f, table), "wb")
+    _replace_atomically(states_file + META_SUFFIX, lambda f: json.dump(meta, f), "w")
+    return load_states_index(states_file)
+
+def _replace_atomically(filename, write, mode):
+    """Write a file through a unique temporary file in the same directory,
+    then move it into place."""
+    fd, tmp_file = tempfile.mkstemp(
+        dir=os.path.dirname(os.path.abspath(filename)),
+        prefix=os.path.basename(filename) + ".",
+        suffix=".tmp"
+    )
+    try:
+        with os.fdopen(fd, mode) as f:
+            write(f)
+        os.replace(tmp_file, filename)
+    except BaseException:
+        if os.path.exists(tmp_file):
+            os.remove(tmp_file)
+        raise
+
+def load_states_index(states_file):
+    """Open the binary states index for a states file, if one exists and was
+    built from the current version of the file.
+    arguments
+        states_file : str
+            Path to the Exomol '.states' file.
+    returns
+        StatesIndex or None
+            The memory-mapped index, or None if it is missing or out of date.
+    """
+    table_file, meta_file = states_file + TABLE_SUFFIX, states_file + META_SUFFIX
+    try:
+        with open(meta_file, "r") as f:
+            meta = json.load(f)
+        if meta.get("version") != INDEX_VERSION or meta.get("source") != _source_stamp(states_file):
+            return None
+        table = np.load(table_file, mmap_mode="r")
+    except (OSError, ValueError):
+        return None
+    return StatesIndex(table, meta["first_id"], meta["columns"], meta["code_tables"])
@@ -0,0 +1,20 @@
+import importlib
+
+class LazyModule:
+    """Stand-in for a module that is only imported when one of its attributes
+    is first used, so that importing llcomp does not pay for heavy
+    dependencies such as pandas and NumPy until a reader or engine needs them.
+    """
+    def __init__(self, name):
+        self._name = name
+        self._module = None
+
+    def __getattr__(self, attr):
+        # Only called for attributes not found on the stand-in itself
+        if self._module is None:
+            self._module = importlib.import_module(self._name)
+        return getattr(self._module, attr)
+
+    def __repr__(self):
+        state = "loaded" if self._module is not None else "not loaded"
+        return "<lazy module '{0}' ({1})>".format(self._name, state)
@@ -1,7 +1,17 @@
-import pandas as pd
-import numpy  as np
-from llcomp.data import detect_file_headers, convert_from_branch, compare_dataframes
+import io, warnings
+from functools import partial
+from llcomp.lazy import LazyModule
+pd = LazyModule("pandas")
+np = LazyModule("numpy")
+from llcomp.data import detect_file_headers, convert_from_branch, compare_dataframes, \
+    iter_file_blocks, iter_dataframe_blocks, empty_dataframe, sample_mask, DEFAULT_BLOCK_SIZE, DEFAULT_QUEUE_SIZE
+from llcomp.index import build_states_index, load_states_index
 
+DEFAULT_MERGE_ON = [ #quantities used to match transitions between linelists
+    "angmom_total_f", "angmom_total_i",
+    "vibrational_f", "vibrational_i",
+    "electronic_state_f", "electronic_state_i"
+]
 
 """
 @todo: Method for comparing linelists
@@ -38,9 +48,11 @@ class LinelistObject:
         "transition_intensity": float
     }
 
-    def __init__(self, df):
+    def __init__(self, df, sample_fraction=None, sample_on=None):
         self.dataframe = df
         self.dataframe_persistent = df
+        self.sample_fraction = sample_fraction #None unless hash-sampled
+        self.sample_on = None if sample_fraction is None else [_ for _ in sample_on]
 
     def reset_data(self):
         """Resets linelist dataframe to original at initialisation time"""
@@ -233,23 +245,129 @@ class MergedLinelist(LinelistObject):
     state_suffixes = ['_f_L', '_i_L', '_f_R', '_i_R'] #possible suffixes for state data
     transition_suffixes = ['_L', '_R'] #possible suffixes for transition data
 
-    def __init__(self, leftLinelist, rightLinelist, merge_on=[
-            "angmom_total_f", "angmom_total_i",
-            "vibrational_f", "vibrational_i",
-            "electronic_state_f", "electronic_state_i"]):
-        merged_df = compare_dataframes(leftLinelist, rightLinelist, merge_on)
-        super().__init__(merged_df)
+    def __init__(self, leftLinelist, rightLinelist, merge_on=DEFAULT_MERGE_ON,
+            sample_fraction=None):
+        """Match the transitions of two linelists.
+        arguments
+            leftLinelist, rightLinelist : Linelist
+                The linelists to merge.
+            merge_on : list of str
+                Quantities used to match transitions.
+            sample_fraction : float or None
+                If given, only merge a deterministic hash-based sample of this
+                fraction of the merge keys. Defaults to the fraction the
+                linelists were sampled with when read, if any.
+        raises
+            ValueError
+                If the linelists were sampled with different fractions, or on
+                keys other than ``merge_on``, or with a fraction other than
+                ``sample_fraction``.
+        """
+        fractions = set()
+        for linelist in (leftLinelist, rightLinelist):
+            if linelist.sample_fraction is None:
+                continue
+            if linelist.sample_on != [_ for _ in merge_on]:
+                raise ValueError("Linelist sampled on {0} cannot be merged on {1}.".format(
+                    linelist.sample_on, merge_on))
+            fractions.add(linelist.sample_fraction)
+        if sample_fraction is not None:
+            fractions.add(sample_fraction)
+        if len(fractions) > 1:
+            raise ValueError("Linelists sampled with different fractions: {0}.".format(
+                sorted(fractions)))
+        sample_fraction = fractions.pop() if fractions else None
+        left_df, right_df = leftLinelist.dataframe, rightLinelist.dataframe
+        if sample_fraction is not None:
+            # Sampling is idempotent, so a linelist sampled when read is unchanged
+            left_df = left_df[sample_mask(left_df, merge_on, sample_fraction)]
+            right_df = right_df[sample_mask(right_df, merge_on, sample_fraction)]
+        merged_df = compare_dataframes(left_df, right_df, merge_on)
+        super().__init__(merged_df, sample_fraction, merge_on)
+        self.merge_on = merge_on
+
+    def approximate_stats(self, column):
+        """Summary statistics of the difference and ratio between the left and
+        right values of a quantity, with error estimates for a sampled merge.
+
+        The sample is of merge keys rather than of lines, and each key can
+        match several lines, so errors are computed per key (cluster
+        sampling): with ``n_k`` matched lines for key ``k`` and sampled
+        fraction ``f``, the error on the estimated number of matched lines is
+        ``sqrt((1-f) * sum(n_k**2)) / f``. The means are ratio estimates over
+        the sampled keys, with errors from the per-key sums. Errors are zero
+        when the merge was not sampled.
+        arguments
+            column : str
+                Quantity to compare, without the '_L'/'_R' suffix.
+        returns
+            stats : Series
+                Number of sampled and estimated total matched lines, and the
+                mean, standard error, standard deviation and maximum absolute
+                value of the diff and ratio.
+        """
+        fraction = 1 if self.sample_fraction is None else self.sample_fraction
+        keys = [self.dataframe[name] for name in self.merge_on]
+        key_lines = self.dataframe.groupby(keys, dropna=False, sort=False).size()
+        num_lines = len(self.dataframe)
+        stats = {
+            "lines_sampled": num_lines,
+            "lines_estimate": num_lines/fraction,
+            "lines_error": np.sqrt((1 - fraction)*(key_lines**2).sum())/fraction
+        }
+        for name, values in (("diff", self.diff(column)), ("ratio", self.ratio(column))):
+            finite = np.isfinite(values)
+            key_sums = pd.DataFrame({
+                "lines": finite.astype(int),
+                "total": values.where(finite, 0)
+            }).groupby(keys, dropna=False, sort=False).sum()
+            num_values = key_sums["lines"].sum()
+            values = values[finite]
+            if num_values:
+                mean = key_sums["total"].sum()/num_values
+                residuals = key_sums["total"] - mean*key_sums["lines"]
+                error = np.sqrt((1 - fraction)*(residuals**2).sum())/num_values
+            else:
+                mean = error = np.nan
+            stats[name+"_mean"] = mean
+            stats[name+"_error"] = error
+            stats[name+"_std"] = values.std()
+            stats[name+"_max_abs"] = values.abs().max()
+        return pd.Series(stats)
 
-def exomol_to_linelist(states_file=None, trans_file=None):
+def exomol_to_linelist(states_file=None, trans_file=None, pipelined=False,
+        block_size=DEFAULT_BLOCK_SIZE, queue_size=DEFAULT_QUEUE_SIZE, states_index=None,
+        sample_fraction=None, sample_on=DEFAULT_MERGE_ON):
     """Convert ExoMol states and trans file to Linelist object.
     arguments
         states_file : str
-            Path to Exomol '.states' file.
+            Path to Exomol '.states' file, optionally '.bz2' compressed.
         trans_file : str
-            Path to Exomol '.trans' file.
+            Path to Exomol '.trans' file, optionally '.bz2' compressed.
+        pipelined : bool
+            If true, read and decompress the files in background threads
+            while previous blocks are parsed and joined.
+        block_size : int
+            Bytes read from disk per block when pipelined.
+        queue_size : int
+            Maximum number of blocks buffered between stages when pipelined.
+        states_index : bool or None
+            If None, look up states in the binary states index when an up to
+            date one exists, instead of parsing the states file. If true, also
+            build the index when it is missing. If false, never use it.
+        sample_fraction : float or None
+            If given, keep only a deterministic hash-based sample of this
+            fraction of the transitions, selected on ``sample_on``. The file
+            is then always read block by block and sampled as it streams. The
+            fraction is recorded on the Linelist for ``MergedLinelist``.
+        sample_on : list of str
+            Quantities hashed to select the sample, i.e the merge keys of a
+            later ``MergedLinelist``.
     returns
         Linelist
-            A Linelist object."""
+            A Linelist object, with one row per transition whose states are
+            both in the states file, in the order of the transitions file
+            (whether or not the states index is used)."""
     exomol_states_types = Linelist.state_data_types
     """
     @todo Convert to merge operator '|' at python 3.9
@@ -259,16 +377,44 @@ def exomol_to_linelist(states_file=None, trans_file=None):
         "state_number_final": int,   #exomol trans files have two 'stateID' columns
         "state_number_initial": int
     }
-    states_columns, _ = detect_file_headers(states_file, [_ for _ in exomol_states_types])
+    block_kwargs = {"block_size": block_size, "queue_size": queue_size}
+    index = None if states_index is False else load_states_index(states_file)
+    if index is not None:
+        join_states = partial(_join_exomol_states, states=index)
+    else:
+        states_columns, _ = detect_file_headers(states_file, [_ for _ in exomol_states_types])
+        if pipelined:
+            states_df = _concat_blocks(
+                iter_dataframe_blocks(states_file, states_columns, exomol_states_types, **block_kwargs),
+                empty_dataframe(states_columns, exomol_states_types)
+            )
+        else:
+            states_df = pd.read_csv(states_file,
+                delim_whitespace=True,
+                index_col=False,
+                header=0, #0-th row as headers
+                skip_blank_lines=True,
+                usecols=[column[1] for column in states_columns],
+                dtype={column[0] : exomol_states_types[column[0]] for column in states_columns}
+            )
+        if states_index:
+            try:
+                build_states_index(states_file, states_df)
+            except OSError as error:
+                warnings.warn("Could not write states index for '{0}': {1}".format(states_file, error))
+        if states_df["state_number"].is_unique:
+            # Hash the state IDs once, so each block costs O(block), not O(states)
+            join_states = partial(_join_exomol_states, states=_StatesFrame(states_df))
+        else:
+            join_states = partial(_merge_exomol_states, states_df=states_df)
     trans_columns, _ = detect_file_headers(trans_file, [_ for _ in exomol_trans_types])
-    states_df = pd.read_csv(states_file,
-        delim_whitespace=True,
-        index_col=False,
-        header=0, #0-th row as headers
-        skip_blank_lines=True,
-        usecols=[column[1] for column in states_columns],
-        dtype={column[0] : exomol_states_types[column[0]] for column in states_columns}
-    )
+    if pipelined or sample_fraction is not None:
+        # Join each block of transitions while the next is read in the background
+        linelist_df = _concat_blocks((
+            _sample_block(join_states(trans_df), sample_fraction, sample_on) for trans_df in
+            iter_dataframe_blocks(trans_file, trans_columns, exomol_trans_types, **block_kwargs)
+        ), join_states(empty_dataframe(trans_columns, exomol_trans_types)))
+        return Linelist(linelist_df, sample_fraction, sample_on)
     trans_df = pd.read_csv(trans_file,
         delim_whitespace=True,
         index_col=False,
@@ -277,6 +423,28 @@ def exomol_to_linelist(states_file=None, trans_file=None):
         usecols=[column[1] for column in trans_columns],
         dtype={column[0] : exomol_trans_types[column[0]] for column in trans_columns}
     )
+    return Linelist(join_states(trans_df))
+
+class _StatesFrame:
+    """States dataframe with the ``positions``/``take`` interface of
+    ``StatesIndex``, for states parsed from the states file."""
+    def __init__(self, states_df):
+        self.states_df = states_df
+        self.state_ids = pd.Index(states_df["state_number"])
+
+    def positions(self, state_ids):
+        """Return the row of each state ID, or -1 if it is not present."""
+        return self.state_ids.get_indexer(state_ids)
+
+    def take(self, positions):
+        """Return the states at the given rows as a dataframe."""
+        return self.states_df.take(positions).reset_index(drop=True)
+
+def _merge_exomol_states(trans_df, states_df):
+    """Join initial and final state data from an ExoMol states dataframe onto
+    an ExoMol transitions dataframe by merging, for states files with
+    duplicate state IDs. Transitions keep their original order."""
+    trans_df = trans_df.assign(trans_row=np.arange(len(trans_df)))
     # Match final state in trans file to stateID in states file
     linelist_df_ = trans_df.merge(states_df, 
         left_on="state_number_final",
@@ -290,9 +458,45 @@ def exomol_to_linelist(states_file=None, trans_file=None):
         suffixes=("_f", "_i"),
         how="inner"
     )
-    return Linelist(linelist_df)
+    linelist_df = linelist_df.sort_values("trans_row", kind="stable")
+    return linelist_df.drop(columns="trans_row").reset_index(drop=True)
+
+def _concat_blocks(block_dfs, empty_df):
+    """Concatenate the dataframes read from each block of a file, or return
+    ``empty_df`` if the file had no lines to read."""
+    block_dfs = [_ for _ in block_dfs]
+    if not block_dfs:
+        return empty_df
+    return pd.concat(block_dfs, ignore_index=True)
 
-def file_to_linelist(linelist_file):
+def _sample_block(block_df, sample_fraction, sample_on):
+    """Keep the hash-based sample of a block of lines, if sampling."""
+    if sample_fraction is None:
+        return block_df
+    return block_df[sample_mask(block_df, sample_on, sample_fraction)]
+
+def _join_exomol_states(trans_df, states):
+    """Join initial and final state data onto an ExoMol transitions dataframe,
+    dropping transitions to or from unknown states. Transitions keep their
+    original order.
+    arguments
+        trans_df : DataFrame
+            Transitions, with 'state_number_final'/'state_number_initial'.
+        states : StatesIndex or _StatesFrame
+            States to look up by state ID.
+    """
+    final_rows = states.positions(trans_df["state_number_final"].to_numpy())
+    initial_rows = states.positions(trans_df["state_number_initial"].to_numpy())
+    found = (final_rows >= 0) & (initial_rows >= 0)
+    return pd.concat([
+        trans_df[found].reset_index(drop=True),
+        states.take(final_rows[found]).add_suffix("_f"),
+        states.take(initial_rows[found]).add_suffix("_i")
+    ], axis=1)
+
+def file_to_linelist(linelist_file, pipelined=False,
+        block_size=DEFAULT_BLOCK_SIZE, queue_size=DEFAULT_QUEUE_SIZE,
+        sample_fraction=None, sample_on=DEFAULT_MERGE_ON):
     """Convert space delimited file to Linelist object.
 
     Converts a space delimited file with the first row as column headers to a
@@ -300,7 +504,22 @@ def file_to_linelist(linelist_file):
     attribute ``state_data_types``.
     arguments
         linelist_file : str
-            Path to the space delimited file.
+            Path to the space delimited file, optionally '.bz2' compressed.
+        pipelined : bool
+            If true, read and decompress the file in background threads
+            while previous blocks are parsed.
+        block_size : int
+            Bytes read from disk per block when pipelined.
+        queue_size : int
+            Maximum number of blocks buffered between stages when pipelined.
+        sample_fraction : float or None
+            If given, keep only a deterministic hash-based sample of this
+            fraction of the lines, selected on ``sample_on``. The file
+            is then always read block by block and sampled as it streams. The
+            fraction is recorded on the Linelist for ``MergedLinelist``.
+        sample_on : list of str
+            Quantities hashed to select the sample, i.e the merge keys of a
+            later ``MergedLinelist``.
     returns
         Linelist : obj
             A ``Linelist`` object.
@@ -311,6 +530,13 @@ def file_to_linelist(linelist_file):
         **Linelist.transition_data_types
     }
     use_columns, _ = detect_file_headers(linelist_file, [_ for _ in file_column_types])
+    if pipelined or sample_fraction is not None:
+        linelist_df = _concat_blocks((
+            _sample_block(block_df, sample_fraction, sample_on) for block_df in
+            iter_dataframe_blocks(linelist_file, use_columns, file_column_types,
+                block_size=block_size, queue_size=queue_size)
+        ), empty_dataframe(use_columns, file_column_types))
+        return Linelist(linelist_df, sample_fraction, sample_on)
     linelist_df = pd.read_csv(linelist_file,
         delim_whitespace=True,
         index_col=False,
@@ -322,11 +548,28 @@ def file_to_linelist(linelist_file):
     
     return Linelist(linelist_df)
 
-def hitran_to_linelist(linelist_file):
+def hitran_to_linelist(linelist_file, pipelined=False,
+        block_size=DEFAULT_BLOCK_SIZE, queue_size=DEFAULT_QUEUE_SIZE,
+        sample_fraction=None, sample_on=DEFAULT_MERGE_ON):
     """Convert Hitran 2004, 160 character '.par' linelist file to Linelist object.
     arguments
         linelist_file : str
-            Path to the Hitran '.par' file.
+            Path to the Hitran '.par' file, optionally '.bz2' compressed.
+        pipelined : bool
+            If true, read and decompress the file in background threads
+            while previous blocks are parsed.
+        block_size : int
+            Bytes read from disk per block when pipelined.
+        queue_size : int
+            Maximum number of blocks buffered between stages when pipelined.
+        sample_fraction : float or None
+            If given, keep only a deterministic hash-based sample of this
+            fraction of the lines, selected on ``sample_on``. The file
+            is then always read block by block and sampled as it streams. The
+            fraction is recorded on the Linelist for ``MergedLinelist``.
+        sample_on : list of str
+            Quantities hashed to select the sample, i.e the merge keys of a
+            later ``MergedLinelist``.
     returns
         Linelist : obj
             A ``Linelist`` object.
@@ -353,16 +596,34 @@ def hitran_to_linelist(linelist_file):
         "upper_degeneracy": float,
         "lower_degeneracy": float
     }
-    linelist_df = pd.read_fwf(linelist_file,
-        widths=[2,1,12,10,10,5,5,10,4,8,15,15,15,15,6,12,1,7,7], #Hitran 2004 '.par'
-        header=None,
-        names=[_ for _ in header_dict],
-        dtype=header_dict
-    )
+    hitran_widths = [2,1,12,10,10,5,5,10,4,8,15,15,15,15,6,12,1,7,7] #Hitran 2004 '.par'
+    if pipelined or sample_fraction is not None:
+        linelist_df = _concat_blocks((
+            _sample_block(_convert_hitran_quanta(pd.read_fwf(io.BytesIO(block),
+                widths=hitran_widths,
+                header=None,
+                names=[_ for _ in header_dict],
+                dtype=header_dict
+            )), sample_fraction, sample_on) for block in iter_file_blocks(linelist_file,
+                block_size=block_size, queue_size=queue_size, skip_header=False)
+            if block.strip()
+        ), _convert_hitran_quanta(empty_dataframe(
+            [[name, n] for n, name in enumerate(header_dict)], header_dict)))
+    else:
+        linelist_df = _convert_hitran_quanta(pd.read_fwf(linelist_file,
+            widths=hitran_widths,
+            header=None,
+            names=[_ for _ in header_dict],
+            dtype=header_dict
+        ))
+    return Linelist(linelist_df, sample_fraction, sample_on)
+
+def _convert_hitran_quanta(linelist_df):
+    """Convert Hitran fields to state quantities and drop unused fields."""
     extract_hitran_global_quanta(linelist_df, 2) #global state quanta from format class 2
     extract_hitran_local_quanta(linelist_df, 5)  #local state quanta from class 5
     linelist_df["energy_f"] = linelist_df["energy_i"] + linelist_df["transition_wavenumber"]
-    linelist_df = linelist_df.drop(columns=[
+    return linelist_df.drop(columns=[
         "molecule_number",
         "isotope_number",
         "air-broadened_width",
@@ -379,7 +640,6 @@ def hitran_to_linelist(linelist_file):
         "branch_electronic",
         "branch_total"
     ])
-    return Linelist(linelist_df)
 
 def extract_hitran_global_quanta(hitran_dataframe, molecule_class):
     """Extract the individual quantum numbers from the Hitran global quanta fields."""
@@ -391,9 +651,11 @@ def extract_hitran_global_quanta(hitran_dataframe, molecule_class):
             lambda joined : [joined.split()[0], float(joined.split()[1])]
         )
         hitran_dataframe[["electronic_state_f", "vibrational_f"]] = pd.DataFrame(
-            hitran_dataframe.upper_state_global.tolist(), index=hitran_dataframe.index) 
+            hitran_dataframe.upper_state_global.tolist(), index=hitran_dataframe.index,
+            columns=["electronic_state_f", "vibrational_f"]) 
         hitran_dataframe[["electronic_state_i", "vibrational_i"]] = pd.DataFrame(
-            hitran_dataframe.lower_state_global.tolist(), index=hitran_dataframe.index)
+            hitran_dataframe.lower_state_global.tolist(), index=hitran_dataframe.index,
+            columns=["electronic_state_i", "vibrational_i"])
     else:
         raise ValueError("Only Hitran molecule class 2 is currently implemented for interpreting global quanta.")
 
@@ -411,15 +673,17 @@ def extract_hitran_local_quanta(hitran_dataframe, molecule_class):
             ]
         )
         # Make local quanta list into dataframe columns
-        hitran_dataframe[[
+        local_columns = [
             "branch_electronic",         #J branch
             "angmom_electronic_i",       #J number
             "branch_total",    #N branch
             "angmom_total_i",  #N numbers
             "transition_moment_key" #Transition moment
-        ]] = pd.DataFrame(
+        ]
+        hitran_dataframe[local_columns] = pd.DataFrame(
             hitran_dataframe.lower_state_local.tolist(), 
-            index=hitran_dataframe.index
+            index=hitran_dataframe.index,
+            columns=local_columns
         )
 
         # Calculate upper state local quanta from branch info
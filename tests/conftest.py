@@ -0,0 +1,31 @@
+import bz2
+import pytest
+
+def _write_multistream_bz2(path, text):
+    """Write text as two concatenated bz2 streams."""
+    data = text.encode()
+    half = len(data)//2
+    path.write_bytes(bz2.compress(data[:half]) + bz2.compress(data[half:]))
+
+def _sorted_frame(df):
+    """Dataframe rows in a canonical order, for comparing loads that may
+    order rows differently."""
+    return df.sort_values([_ for _ in df.columns]).reset_index(drop=True)
+
+@pytest.fixture
+def write_bz2():
+    return _write_multistream_bz2
+
+@pytest.fixture
+def sorted_frame():
+    return _sorted_frame
+
+@pytest.fixture
+def exomol_files(tmp_path, request):
+    """Write the test module's STATES_TEXT and TRANS_TEXT as ExoMol files,
+    plus multi-stream '.bz2' copies, and return the uncompressed paths."""
+    states_file, trans_file = tmp_path / "x.states", tmp_path / "x.trans"
+    for path, text in ((states_file, request.module.STATES_TEXT), (trans_file, request.module.TRANS_TEXT)):
+        path.write_text(text)
+        _write_multistream_bz2(path.with_name(path.name + ".bz2"), text)
+    return str(states_file), str(trans_file)
@@ -0,0 +1,111 @@
+import os, threading
+import numpy  as np
+import pandas as pd
+import pytest
+
+import llcomp.index
+from llcomp.index import build_states_index, load_states_index
+from llcomp.linelist import exomol_to_linelist
+
+# Sparse state IDs, string labels including a missing one
+STATES_TEXT = """state_number energy angmom_total vibrational parity_total electronic_state
+3 0.0 0.5 0 + X
+4 10.0 1.5 0 - X
+7 20.0 0.5 1 + A
+8 30.0 1.5 1 - NaN
+20 40.0 2.5 2 + B
+"""
+# Includes transitions to and from state IDs missing from the states file
+TRANS_TEXT = """state_number_final state_number_initial einstein_coefficient
+4 3 1.0
+7 3 2.0
+8 4 3.0
+20 8 4.0
+5 3 5.0
+7 6 6.0
+21 20 7.0
+1 2 8.0
+"""
+
+@pytest.mark.parametrize("pipelined", [False, True])
+def test_index_matches_states_file(exomol_files, pipelined):
+    states_file, trans_file = exomol_files
+    baseline = exomol_to_linelist(states_file, trans_file, states_index=False).dataframe
+    exomol_to_linelist(states_file, trans_file, states_index=True)
+    assert load_states_index(states_file) is not None
+    indexed = exomol_to_linelist(states_file, trans_file, pipelined=pipelined).dataframe
+    # Rows are in transitions file order, with or without the index
+    assert indexed["einstein_coefficient"].tolist() == [1.0, 2.0, 3.0, 4.0]
+    assert indexed["electronic_state_f"].isna().sum() == 1
+    pd.testing.assert_frame_equal(baseline, indexed)
+
+def test_duplicate_state_ids_keep_transitions_order(tmp_path):
+    states_file, trans_file = str(tmp_path / "x.states"), str(tmp_path / "x.trans")
+    (tmp_path / "x.states").write_text(STATES_TEXT + "4 11.0 1.5 0 - X\n")
+    (tmp_path / "x.trans").write_text(TRANS_TEXT)
+    linelist_df = exomol_to_linelist(states_file, trans_file, states_index=False).dataframe
+    assert linelist_df["einstein_coefficient"].tolist() == [1.0, 1.0, 2.0, 3.0, 3.0, 4.0]
+    assert linelist_df["energy_f"].tolist()[:2] == [10.0, 11.0]
+    assert linelist_df["energy_i"].tolist()[3:5] == [10.0, 11.0]
+
+def test_lookup(exomol_files):
+    states_file, trans_file = exomol_files
+    exomol_to_linelist(states_file, trans_file, states_index=True)
+    index = load_states_index(states_file)
+    assert len(index) == 18 #one row per ID from 3 to 20
+    states = index.lookup([20, 5, 3, 100, 8])
+    assert states["state_number"].tolist() == [20, 3, 8]
+    assert states["parity_total"].tolist() == ["+", "+", "-"]
+    assert states["electronic_state"].tolist()[:2] == ["B", "X"]
+    assert np.isnan(states["electronic_state"].iloc[2])
+
+def test_empty_index(tmp_path):
+    states_file, trans_file = str(tmp_path / "x.states"), str(tmp_path / "x.trans")
+    (tmp_path / "x.states").write_text(STATES_TEXT.split("\n", 1)[0] + "\n")
+    (tmp_path / "x.trans").write_text(TRANS_TEXT)
+    baseline = exomol_to_linelist(states_file, trans_file, states_index=True).dataframe
+    index = load_states_index(states_file)
+    assert len(index) == 0
+    assert len(index.lookup([1, 2])) == 0
+    indexed = exomol_to_linelist(states_file, trans_file).dataframe
+    assert len(indexed) == 0
+    assert list(indexed.columns) == list(baseline.columns)
+
+def test_index_out_of_date(exomol_files):
+    states_file, trans_file = exomol_files
+    exomol_to_linelist(states_file, trans_file, states_index=True)
+    with open(states_file, "a") as f:
+        f.write("21 50.0 3.5 2 - B\n")
+    assert load_states_index(states_file) is None
+    linelist_df = exomol_to_linelist(states_file, trans_file).dataframe
+    assert 7.0 in linelist_df["einstein_coefficient"].tolist()
+
+def test_concurrent_builds(exomol_files):
+    states_file, trans_file = exomol_files
+    states_df = pd.read_csv(states_file, delim_whitespace=True)
+    errors = []
+    def build():
+        try:
+            for _ in range(20):
+                build_states_index(states_file, states_df)
+        except Exception as error:
+            errors.append(error)
+    threads = [threading.Thread(target=build) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert errors == []
+    assert load_states_index(states_file) is not None
+    assert not [_ for _ in os.listdir(os.path.dirname(states_file)) if _.endswith(".tmp")]
+
+def test_unwritable_index_warns(exomol_files, sorted_frame, monkeypatch):
+    states_file, trans_file = exomol_files
+    def read_only(*args, **kwargs):
+        raise PermissionError("read-only directory")
+    monkeypatch.setattr(llcomp.index.tempfile, "mkstemp", read_only)
+    baseline = exomol_to_linelist(states_file, trans_file, states_index=False).dataframe
+    with pytest.warns(UserWarning, match="Could not write states index"):
+        linelist_df = exomol_to_linelist(states_file, trans_file, states_index=True).dataframe
+    pd.testing.assert_frame_equal(sorted_frame(baseline), sorted_frame(linelist_df))
+    assert load_states_index(states_file) is None
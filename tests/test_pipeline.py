@@ -0,0 +1,106 @@
+import threading, timeit
+import numpy  as np
+import pandas as pd
+import pytest
+
+from llcomp.data import iter_file_blocks, iter_dataframe_blocks
+from llcomp.linelist import exomol_to_linelist, file_to_linelist, \
+    _StatesFrame, _join_exomol_states
+
+STATES_TEXT = "state_number energy angmom_total vibrational electronic_state\n" + "".join(
+    "{0} {1:.4f} {2}.5 {3} {4}\n".format(i, i*10.5, i % 7, i % 3, "XAB"[i % 3])
+    for i in range(1, 301)
+)
+TRANS_TEXT = "state_number_final state_number_initial einstein_coefficient\n" + "".join(
+    "{0} {1} {2:.4e}\n".format(1 + (i*37) % 300, 1 + (i*11) % 300, 1e-3*(i + 1))
+    for i in range(2000)
+)
+
+@pytest.mark.parametrize("block_size", [1, 7, 4096])
+def test_multistream_bz2_blocks_match_text(exomol_files, block_size):
+    _, trans_file = exomol_files
+    blocks = [_ for _ in iter_file_blocks(trans_file + ".bz2",
+        block_size=block_size, queue_size=2)]
+    assert all(block.endswith(b"\n") for block in blocks)
+    assert b"".join(blocks).decode() == TRANS_TEXT.split("\n", 1)[1]
+
+def test_decompressed_blocks_are_capped(tmp_path, write_bz2):
+    text = "1 2 3.0000e-01\n" * 100000 #compresses by orders of magnitude
+    write_bz2(tmp_path / "x.bz2", "a b c\n" + text)
+    blocks = [_ for _ in iter_file_blocks(str(tmp_path / "x.bz2"), block_size=1024)]
+    assert max(len(block) for block in blocks) <= 1024 + len("1 2 3.0000e-01\n")
+    assert b"".join(blocks).decode() == text
+
+def test_last_line_without_newline(tmp_path):
+    (tmp_path / "x.txt").write_text("a b\n1 2\n3 4")
+    blocks = [_ for _ in iter_file_blocks(str(tmp_path / "x.txt"), block_size=3)]
+    assert b"".join(blocks) == b"1 2\n3 4"
+
+def test_crlf_line_endings(tmp_path):
+    (tmp_path / "x.txt").write_bytes(b"energy_f energy_i\r\n1.5 1.0\r\n2.5 2.0\r\n")
+    df = pd.concat(iter_dataframe_blocks(str(tmp_path / "x.txt"),
+        [["energy_f", 0], ["energy_i", 1]], {"energy_f": float, "energy_i": float},
+        block_size=5))
+    assert df["energy_f"].tolist() == [1.5, 2.5]
+    assert df["energy_i"].tolist() == [1.0, 2.0]
+
+def test_errors_are_raised_in_caller(tmp_path):
+    with pytest.raises(FileNotFoundError):
+        [_ for _ in iter_file_blocks(str(tmp_path / "missing.bz2"))]
+    (tmp_path / "corrupt.bz2").write_bytes(b"not a bz2 stream")
+    with pytest.raises(OSError):
+        [_ for _ in iter_file_blocks(str(tmp_path / "corrupt.bz2"))]
+
+def test_close_stops_threads(exomol_files):
+    num_threads = threading.active_count()
+    _, trans_file = exomol_files
+    blocks = iter_file_blocks(trans_file + ".bz2", block_size=16, queue_size=1)
+    next(blocks)
+    blocks.close()
+    assert threading.active_count() == num_threads
+
+@pytest.mark.parametrize("suffix", ["", ".bz2"])
+def test_pipelined_exomol_matches_baseline(exomol_files, sorted_frame, suffix):
+    states_file, trans_file = exomol_files
+    baseline = exomol_to_linelist(states_file, trans_file, states_index=False).dataframe
+    pipelined = exomol_to_linelist(states_file + suffix, trans_file + suffix,
+        pipelined=True, block_size=64, queue_size=2, states_index=False).dataframe
+    pd.testing.assert_frame_equal(sorted_frame(baseline), sorted_frame(pipelined))
+
+def test_pipelined_header_only_files(tmp_path):
+    (tmp_path / "x.states").write_text(STATES_TEXT.split("\n", 1)[0] + "\n")
+    (tmp_path / "x.trans").write_text(TRANS_TEXT.split("\n", 1)[0] + "\n")
+    (tmp_path / "x.txt").write_text("energy_f energy_i\n\n")
+    baseline = exomol_to_linelist(str(tmp_path / "x.states"), str(tmp_path / "x.trans"),
+        states_index=False).dataframe
+    pipelined = exomol_to_linelist(str(tmp_path / "x.states"), str(tmp_path / "x.trans"),
+        pipelined=True, states_index=False).dataframe
+    assert len(pipelined) == 0
+    assert list(pipelined.columns) == list(baseline.columns)
+    assert len(file_to_linelist(str(tmp_path / "x.txt"), pipelined=True).dataframe) == 0
+
+def test_pipelined_exomol_does_not_merge_per_block(exomol_files, monkeypatch):
+    def merge(*args, **kwargs):
+        raise AssertionError("transitions blocks should not be merged against all states")
+    monkeypatch.setattr(pd.DataFrame, "merge", merge)
+    states_file, trans_file = exomol_files
+    linelist_df = exomol_to_linelist(states_file, trans_file,
+        pipelined=True, block_size=1024, states_index=False).dataframe
+    assert len(linelist_df) == 2000
+
+def test_block_join_cost_independent_of_states_size():
+    rng = np.random.default_rng(0)
+    trans_df = pd.DataFrame({
+        "state_number_final": rng.integers(1, 1000, 2000),
+        "state_number_initial": rng.integers(1, 1000, 2000),
+        "einstein_coefficient": rng.random(2000)
+    })
+    def block_join_time(num_states):
+        states = _StatesFrame(pd.DataFrame({
+            "state_number": np.arange(1, num_states + 1),
+            "energy": rng.random(num_states)
+        }))
+        _join_exomol_states(trans_df, states) #builds the state ID lookup
+        return min(timeit.repeat(lambda: _join_exomol_states(trans_df, states), number=3, repeat=5))
+    # Merging each block against all states would be hundreds of times slower
+    assert block_join_time(1000000) < 5*block_join_time(1000)
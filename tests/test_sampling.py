@@ -0,0 +1,106 @@
+import numpy  as np
+import pandas as pd
+import pytest
+
+from llcomp.data import sample_mask
+from llcomp.linelist import Linelist, MergedLinelist, file_to_linelist, DEFAULT_MERGE_ON
+
+def clustered_linelist(seed, num_keys=3000, max_lines=12):
+    """Synthetic linelist in which each merge key has several lines."""
+    rng = np.random.default_rng(seed)
+    key_ids = np.repeat(np.arange(num_keys), rng.integers(1, max_lines, num_keys))
+    return Linelist(pd.DataFrame({
+        "angmom_total_f": key_ids % 40 + 0.5,
+        "angmom_total_i": key_ids % 40 + 1.5,
+        "vibrational_f": key_ids // 40,
+        "vibrational_i": key_ids // 400,
+        "electronic_state_f": "X",
+        "electronic_state_i": np.where(key_ids % 2, "A", "X"),
+        "einstein_coefficient": rng.lognormal(0, 1, len(key_ids)) * (1 + key_ids % 5)
+    }))
+
+@pytest.fixture(scope="module")
+def linelists():
+    return clustered_linelist(1), clustered_linelist(2)
+
+def test_sample_mask_ignores_key_types():
+    keys = pd.DataFrame({"a": np.arange(1000), "b": ["X", "A"]*500})
+    as_float = keys.astype({"a": float})
+    as_object = keys.astype({"a": object})
+    mask = sample_mask(keys, ["a", "b"], 0.3)
+    assert 200 < mask.sum() < 400
+    assert (mask == sample_mask(as_float, ["a", "b"], 0.3)).all()
+    assert (mask == sample_mask(as_object, ["a", "b"], 0.3)).all()
+
+def test_sample_mask_independent_of_other_values():
+    labels = pd.DataFrame({"a": ["1", "X", "3", "1.0", "B", None, "2.5", "X"]*50})
+    whole = sample_mask(labels, ["a"], 0.5)
+    for size in (1, 2, 3):
+        blocks = np.concatenate([
+            sample_mask(labels.iloc[start:start+size], ["a"], 0.5)
+            for start in range(0, len(labels), size)
+        ])
+        assert (blocks == whole).all()
+    numeric = pd.DataFrame({"a": [1.0, 3.0, 2.5]})
+    assert (sample_mask(numeric, ["a"], 0.5) == whole[[0, 2, 6]]).all()
+    assert whole[0] == whole[3] #"1" and "1.0" are the same key
+
+@pytest.mark.parametrize("fraction", [0.05, 0.1, 0.2, 0.5])
+def test_estimates_within_errors(linelists, fraction):
+    left, right = linelists
+    full = MergedLinelist(left, right)
+    sampled = MergedLinelist(left, right, sample_fraction=fraction)
+    stats = sampled.approximate_stats("einstein_coefficient")
+    assert stats["lines_sampled"] < len(full.dataframe)
+    assert abs(stats["lines_estimate"] - len(full.dataframe)) < 4*stats["lines_error"]
+    true_diff = full.diff("einstein_coefficient").mean()
+    assert abs(stats["diff_mean"] - true_diff) < 4*stats["diff_error"]
+    true_ratio = full.ratio("einstein_coefficient").mean()
+    assert abs(stats["ratio_mean"] - true_ratio) < 4*stats["ratio_error"]
+
+def test_unsampled_stats_are_exact(linelists):
+    left, right = linelists
+    full = MergedLinelist(left, right)
+    stats = full.approximate_stats("einstein_coefficient")
+    assert stats["lines_estimate"] == len(full.dataframe)
+    assert stats["lines_error"] == 0
+    assert stats["diff_mean"] == pytest.approx(full.diff("einstein_coefficient").mean())
+
+def test_sampled_reader_matches_sampled_merge(linelists, tmp_path):
+    left, _ = linelists
+    left.dataframe.to_csv(tmp_path / "left.txt", sep=" ", index=False)
+    sampled = file_to_linelist(str(tmp_path / "left.txt"), sample_fraction=0.1, block_size=65536)
+    expected = left.dataframe[sample_mask(left.dataframe, DEFAULT_MERGE_ON, 0.1)]
+    assert len(sampled.dataframe) == len(expected)
+    assert sampled.dataframe["einstein_coefficient"].tolist() == pytest.approx(
+        expected["einstein_coefficient"].tolist())
+
+def test_merge_inherits_reader_fraction(linelists, tmp_path):
+    left, right = linelists
+    left.dataframe.to_csv(tmp_path / "left.txt", sep=" ", index=False)
+    right.dataframe.to_csv(tmp_path / "right.txt", sep=" ", index=False)
+    sampled_left = file_to_linelist(str(tmp_path / "left.txt"), sample_fraction=0.2)
+    sampled_right = file_to_linelist(str(tmp_path / "right.txt"), sample_fraction=0.2)
+    assert sampled_left.sample_fraction == 0.2
+    assert sampled_left.sample_on == DEFAULT_MERGE_ON
+    inherited = MergedLinelist(sampled_left, sampled_right)
+    explicit = MergedLinelist(left, right, sample_fraction=0.2)
+    assert inherited.sample_fraction == 0.2
+    stats = inherited.approximate_stats("einstein_coefficient")
+    assert stats["lines_error"] > 0
+    assert stats["lines_sampled"] == len(explicit.dataframe)
+    assert stats["lines_error"] == pytest.approx(
+        explicit.approximate_stats("einstein_coefficient")["lines_error"])
+    # One sampled side is enough, the other is sampled to match
+    assert len(MergedLinelist(sampled_left, right).dataframe) == len(explicit.dataframe)
+
+def test_merge_rejects_mismatched_samples(linelists):
+    left, right = linelists
+    tenth = Linelist(left.dataframe, 0.1, DEFAULT_MERGE_ON)
+    with pytest.raises(ValueError):
+        MergedLinelist(tenth, Linelist(right.dataframe, 0.2, DEFAULT_MERGE_ON))
+    with pytest.raises(ValueError):
+        MergedLinelist(tenth, right, sample_fraction=0.2)
+    with pytest.raises(ValueError):
+        MergedLinelist(tenth, right, merge_on=DEFAULT_MERGE_ON[:4])
+    assert MergedLinelist(tenth, right, sample_fraction=0.1).sample_fraction == 0.1
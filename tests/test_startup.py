@@ -0,0 +1,17 @@
+import os, subprocess, sys
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+IMPORT_SNIPPET = """
+import sys
+sys.argv = ["duo_fit_inp.py", "--no-such-option"] #would make argparse exit
+import llcomp.linelist, duo_fit_inp
+print(",".join(name for name in ["pandas", "numpy"] if name in sys.modules))
+"""
+
+def test_import_has_no_side_effects():
+    result = subprocess.run([sys.executable, "-c", IMPORT_SNIPPET],
+        cwd=REPO_ROOT, capture_output=True, text=True)
+    assert result.returncode == 0, result.stderr
+    assert result.stderr == ""
+    assert result.stdout.strip() == "" #neither pandas nor numpy was imported